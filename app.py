@@ -1,49 +1,147 @@
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
+import plotly.io as pio
 import numpy as np
-from dash import Dash, dcc, html, Input, Output, State, callback_context
+from dash import Dash, dcc, html, Input, Output, State, Patch, callback_context, no_update
 import base64
+import hashlib
 import io
+from collections import OrderedDict
 
-# Define the time to seconds function
+# Use the multi-threaded PyArrow CSV parser when it is installed
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pacsv = None
+
+# Define the shared figure styling once as a lean template, which replaces the much
+# larger default 'plotly' template in every serialized figure
+AXIS_STYLE = dict(
+    automargin=True,
+    gridcolor='white',
+    linecolor='white',
+    zerolinecolor='white',
+    zerolinewidth=2,
+    ticks='',
+    title_standoff=15,
+    title_font_size=16,
+    tickfont_size=14,
+)
+RACE_TEMPLATE = go.layout.Template(layout=dict(
+    title_x=0.05,
+    title_font_size=24,
+    title_font_family="SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif",
+    font_family="SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif",
+    font_color='#2a3f5f',
+    xaxis=AXIS_STYLE,
+    yaxis=AXIS_STYLE,
+    hoverlabel_align='left',
+    hovermode='closest',
+    showlegend=False,
+    height=600,
+    plot_bgcolor='rgba(240,240,240,0.8)',  # Light grey background
+    paper_bgcolor='white',
+    margin=dict(l=50, r=50, t=80, b=50),
+))
+pio.templates['race'] = RACE_TEMPLATE
+
+# Built figures keyed on (upload digest, filename, mode), so the cache doesn't hold on
+# to the base64 payloads; bounded, with the oldest entry evicted first
+FIGURE_CACHE_SIZE = 8
+figure_cache = OrderedDict()
+
+# Define the time to seconds function, used for columns that can't be parsed in one pass
 def time_to_seconds(time_str):
     if pd.isna(time_str) or time_str == '00:00:00':
         return np.nan
     parts = time_str.split(':')
-    if len(parts) == 3:
-        h, m, s = parts
-        return int(h) * 3600 + int(m) * 60 + int(s)
-    elif len(parts) == 2:
-        m, s = parts
-        return int(m) * 60 + int(s)
-    else:
-        return int(parts[0])
+    try:
+        if len(parts) == 3:
+            h, m, s = parts
+            return int(h) * 3600 + int(m) * 60 + int(s)
+        elif len(parts) == 2:
+            m, s = parts
+            return int(m) * 60 + int(s)
+        else:
+            return int(parts[0])
+    except ValueError:
+        # Entries such as 'DNF' or 'DNS' carry no time
+        return np.nan
+
+# Fast path for the dominant 'HH:MM:SS' layout, slicing fixed positions instead of splitting
+def fast_time_to_seconds(time_str):
+    if type(time_str) is str and len(time_str) == 8 and time_str[2] == ':' and time_str[5] == ':' and time_str != '00:00:00':
+        try:
+            return int(time_str[0:2]) * 3600 + int(time_str[3:5]) * 60 + int(time_str[6:8])
+        except ValueError:
+            pass
+    return time_to_seconds(time_str)
+
+# Convert a column of time strings to seconds
+def times_to_seconds(series):
+    # Normalize to the string dtype so the .str accessor also works on all-missing (float) columns
+    series = series.astype('string')
+    series = series.mask(series.eq('00:00:00'))
+    try:
+        parts = series.str.split(':', expand=True).replace('', np.nan).astype('float32').to_numpy()
+    except ValueError:
+        # Mixed formats fall back to converting one value at a time into a preallocated array
+        seconds = np.fromiter(map(fast_time_to_seconds, series.to_numpy()), dtype=np.float32, count=len(series))
+        return pd.Series(seconds, index=series.index)
+    # Right-align the parts so 'MM:SS' and 'SS' entries get the correct weights
+    n_parts = (~np.isnan(parts)).sum(axis=1)
+    exponents = n_parts[:, None] - 1 - np.arange(parts.shape[1])
+    seconds = np.nansum(parts * 60.0 ** exponents, axis=1)
+    seconds[n_parts == 0] = np.nan
+    return pd.Series(seconds, index=series.index, dtype='float32')
 
 # Function to process the uploaded file
 def process_data(contents, filename):
     content_type, content_string = contents.split(',')
     decoded = base64.b64decode(content_string)
+    time_columns = ['Swim', 'T1', 'Bike', 'T2', 'Run', 'Total Time']
     try:
         if 'csv' in filename:
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
+            # Only parse the columns the figure needs, so no column selection is needed afterwards
+            columns = ['Position', 'Athlete First Name', 'Athlete Last Name'] + time_columns
+            if pacsv is not None:
+                # Read times as plain strings; PyArrow would otherwise infer 'MM:SS' values as a time of day
+                convert_options = pacsv.ConvertOptions(include_columns=columns,
+                                                       column_types={col: pa.string() for col in time_columns},
+                                                       strings_can_be_null=True)
+                df = pacsv.read_csv(io.BytesIO(decoded), convert_options=convert_options).to_pandas()
+            else:
+                df = pd.read_csv(io.BytesIO(decoded), usecols=columns)
         else:
             return None, "Unsupported file type. Please upload a CSV file."
     except Exception as e:
         return None, str(e)
 
     # Convert time strings to seconds
-    time_columns = ['Swim', 'T1', 'Bike', 'T2', 'Run', 'Total Time']
     for col in time_columns:
-        df[col] = df[col].apply(time_to_seconds)
+        df[col] = times_to_seconds(df[col])
 
-    # Calculate cumulative times
+    # Calculate cumulative times, which inherit float32 from the parsed times
     segments = ['Swim', 'T1', 'Bike', 'T2', 'Run']
-    df['Swim_Cum'] = df['Swim']
-    for i in range(1, len(segments)):
-        df[f'{segments[i]}_Cum'] = df[f'{segments[i-1]}_Cum'] + df[segments[i]]
+    cum = df[segments].cumsum(axis=1, skipna=False)
+    cum.columns = [f'{seg}_Cum' for seg in segments]
+
+    df = pd.concat([df, cum], axis=1)
+
+    # Store names as categoricals and build the display name once
+    df['Athlete First Name'] = df['Athlete First Name'].astype('category')
+    df['Athlete Last Name'] = df['Athlete Last Name'].astype('category')
+    df['Athlete Name'] = (df['Athlete First Name'].astype(str) + ' ' + df['Athlete Last Name'].astype(str)).astype('category')
+
+    # Finishing order doesn't change, so sort once here rather than per figure
+    df = df.sort_values('Position', na_position='last').reset_index(drop=True)
 
-    return df, None
+    # Time gap plots only show finishers, so split them out once here
+    finishers = df[df['Run_Cum'].notna()].reset_index(drop=True)
+
+    return {'all': df, 'finishers': finishers}, None
 
 # Create the app
 app = Dash(__name__)
@@ -175,6 +273,7 @@ app.layout = html.Div([
         html.Button('Visualize', id='visualize-button', className='btn-primary', disabled=True),
         html.Div(id='output-data-upload'),
         dcc.Graph(id='race-plot', style={'height': '600px', 'display': 'none'}),
+        dcc.Store(id='figure-key'),
         html.Div(id='hover-data')
     ], className='container')
 ])
@@ -196,124 +295,185 @@ def update_button_state_and_message(contents, filename):
 @app.callback(
     Output('race-plot', 'figure'),
     Output('race-plot', 'style'),
+    Output('figure-key', 'data'),
     Input('visualize-button', 'n_clicks'),
     Input('calculation-mode', 'value'),
-    Input('race-plot', 'hoverData'),
     State('upload-data', 'contents'),
     State('upload-data', 'filename')
 )
-def update_graph(n_clicks, calculation_mode, hoverData, contents, filename):
+def update_graph(n_clicks, calculation_mode, contents, filename):
     ctx = callback_context
     triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
 
-    if contents is None or calculation_mode is None:
-        return go.Figure(), {'display': 'none'}
+    if contents is None or calculation_mode is None or triggered_id != 'visualize-button':
+        return go.Figure(), {'display': 'none'}, None
 
-    df, error_message = process_data(contents, filename)
-    if error_message:
-        return go.Figure(), {'display': 'none'}
+    # Reuse the built figure when the same upload is visualized again in the same mode
+    figure_key = (hashlib.md5(contents.encode()).hexdigest(), filename, calculation_mode)
+    cached = figure_cache.get(figure_key)
+    if cached is None:
+        race_data, error_message = process_data(contents, filename)
+        if error_message:
+            return go.Figure(), {'display': 'none'}, None
+        cached = figure_cache[figure_key] = create_figure(race_data, calculation_mode, filename)
+        if len(figure_cache) > FIGURE_CACHE_SIZE:
+            figure_cache.popitem(last=False)
+    fig, athlete_paths = cached
 
-    if triggered_id == 'visualize-button':
-        return create_figure(df, calculation_mode, filename), {'display': 'block', 'height': '600px'}
-    elif triggered_id == 'race-plot' and hoverData is not None:
-        hovered_name = hoverData['points'][0]['text'].split('<br>')[0]
-        return create_figure(df, calculation_mode, filename, hovered_athlete=hovered_name), {'display': 'block', 'height': '600px'}
-    else:
-        return go.Figure(), {'display': 'none'}
+    # Only the cache key goes to the browser; hover looks the athlete paths up server-side
+    return fig, {'display': 'block', 'height': '600px'}, list(figure_key)
+
+# Highlight the hovered athlete by patching the existing figure instead of rebuilding it
+@app.callback(
+    Output('race-plot', 'figure', allow_duplicate=True),
+    Input('race-plot', 'hoverData'),
+    State('figure-key', 'data'),
+    prevent_initial_call=True
+)
+def highlight_athlete(hoverData, figure_key):
+    if hoverData is None or figure_key is None:
+        return no_update
+
+    # The figure may have been evicted from the cache since it was drawn
+    cached = figure_cache.get(tuple(figure_key))
+    if cached is None:
+        return no_update
+    athlete_paths = cached[1]
+
+    # The athlete index travels with every point, so no name lookup is needed
+    i = hoverData['points'][0].get('customdata', [None])[0]
+    if i is None:
+        return no_update
+
+    patch = Patch()
+    n_groups = athlete_paths['n_groups']
+    for group in range(n_groups):
+        patch['data'][group]['opacity'] = 0.2
+    patch['data'][n_groups]['x'] = athlete_paths['x'][i]
+    patch['data'][n_groups]['y'] = athlete_paths['y'][i]
+    patch['data'][n_groups]['customdata'] = athlete_paths['customdata'][i]
+    patch['data'][n_groups]['line']['color'] = athlete_paths['colors'][i]
+    patch['data'][n_groups]['marker']['color'] = athlete_paths['colors'][i]
+    return patch
 
 # Create the figure function
-def create_figure(df, calculation_mode, filename, hovered_athlete=None):
+def create_figure(race_data, calculation_mode, filename):
     fig = go.Figure()
 
     segments = ['Swim', 'T1', 'Bike', 'T2', 'Run']
     x_values = [0, 0.5, 0.6, 2.0, 2.1, 3.0]
     x_labels = ['Start'] + segments
 
+    cum_columns = [f'{seg}_Cum' for seg in segments]
     if calculation_mode == 'position':
-        for split in [f'{seg}_Cum' for seg in segments]:
-            df[f'{split}_Rank'] = df[split].rank(method='min', na_option='bottom')
-        max_rank = df[[f'{split}_Cum_Rank' for split in segments]].max().max()
+        df = race_data['all']
+        y_matrix = df[cum_columns].rank(method='min', na_option='bottom').to_numpy()
+        max_rank = y_matrix.max(initial=0)
         y_axis_title = 'Rank'
     else:  # time_gap mode
-        for split in [f'{seg}_Cum' for seg in segments]:
-            leader_time = df[split].min()
-            df[f'{split}_Gap'] = df[split] - leader_time
-        max_gap = df[[f'{seg}_Cum_Gap' for seg in segments]].max().max()
+        # One reduction over the stacked splits gives every leader time at once;
+        # leaders and the axis range come from the whole field, but only finishers are drawn
+        cum_matrix = race_data['all'][cum_columns].to_numpy()
+        leaders = np.nanmin(cum_matrix, axis=0, initial=np.inf)
+        max_gap = np.nanmax(cum_matrix - leaders, initial=0)
         y_axis_title = 'Time Gap to Leader (seconds)'
-        
-        df = df[df['Run_Cum'].notna()]
 
-    df = df.sort_values('Position', na_position='last')
+        df = race_data['finishers']
+        y_matrix = df[cum_columns].to_numpy() - leaders
 
     # Create a color palette
     color_palette = px.colors.qualitative.Bold
 
-    for i, (_, athlete) in enumerate(df.iterrows()):
-        name = f"{athlete['Athlete First Name']} {athlete['Athlete Last Name']}"
-        y_values = [0]
-        athlete_x_values = [x_values[0]]
-        for j, seg in enumerate(segments):
-            if calculation_mode == 'position':
-                value = athlete[f'{seg}_Cum_Rank']
-            else:
-                value = athlete[f'{seg}_Cum_Gap']
-            if pd.isna(value):
-                break
-            y_values.append(value)
-            athlete_x_values.append(x_values[j+1])
+    # Pull names out as an array once instead of iterating rows
+    names = df['Athlete Name'].to_numpy()
+    # Cumulative values are NaN from the first missing split onwards, so each
+    # athlete's path ends just before their first NaN
+    nan_mask = np.isnan(y_matrix)
+    n_valid = np.where(nan_mask.any(axis=1), nan_mask.argmax(axis=1), len(segments))
+    x_array = np.array(x_values)
+    separator = np.array([np.nan])
+    groups = np.arange(len(df)) % len(color_palette)
+    colors = [color_palette[group] for group in groups]
+
+    # Hover labels are formatted by Plotly from per-point customdata of [athlete index, name, segment]
+    hovertemplate = '%{customdata[1]}<br>Segment: %{customdata[2]}<br>' + y_axis_title + ': %{y:.0f}<extra></extra>'
 
-        if calculation_mode == 'position' and len(y_values) < len(segments) + 1:
-            y_values.append(max_rank)
-            athlete_x_values.append(athlete_x_values[-1])
+    # Athletes sharing a palette color are drawn as a single trace, with NaN
+    # separators so each athlete still renders as its own polyline
+    n_groups = min(len(color_palette), len(df))
+    group_x = [[] for _ in range(n_groups)]
+    group_y = [[] for _ in range(n_groups)]
+    group_customdata = [[] for _ in range(n_groups)]
+    # Per-athlete paths, cached with the figure, let the hover callback fill the highlight trace without a rebuild
+    athlete_paths = dict(x=[], y=[], customdata=[], colors=colors, n_groups=n_groups)
 
-        opacity = 1 if hovered_athlete == name else 0.2 if hovered_athlete else 0.6
+    for i in range(len(df)):
+        name = names[i]
+        end = n_valid[i]
+        y_values = np.concatenate(([0], y_matrix[i, :end]))
+        athlete_x_values = x_array[:end + 1]
+        point_labels = x_labels[:end + 1]
 
-        hover_text = [f"{name}<br>Segment: {seg}<br>{y_axis_title}: {y:.0f}" for seg, y in zip(['Start'] + segments, y_values)]
+        if calculation_mode == 'position' and end < len(segments):
+            y_values = np.append(y_values, max_rank)
+            athlete_x_values = np.append(athlete_x_values, athlete_x_values[-1])
+            point_labels.append(point_labels[-1])
 
-        fig.add_trace(go.Scatter(
-            x=athlete_x_values,
-            y=y_values,
+        customdata = [[i, name, label] for label in point_labels]
+
+        group = groups[i]
+        group_x[group] += [athlete_x_values, separator]
+        group_y[group] += [y_values, separator]
+        group_customdata[group] += customdata + [[None, None, None]]
+
+        athlete_paths['x'].append(athlete_x_values)
+        athlete_paths['y'].append(y_values)
+        athlete_paths['customdata'].append(customdata)
+
+    for group in range(n_groups):
+        fig.add_trace(go.Scattergl(
+            x=np.concatenate(group_x[group]),
+            y=np.concatenate(group_y[group]),
             mode='lines+markers',
-            name=name,
-            text=hover_text,
-            hoverinfo='text',
-            line=dict(width=2, color=color_palette[i % len(color_palette)]),
-            marker=dict(size=8, color=color_palette[i % len(color_palette)]),
-            opacity=opacity
+            customdata=group_customdata[group],
+            hovertemplate=hovertemplate,
+            line=dict(width=2, color=color_palette[group]),
+            marker=dict(size=8, color=color_palette[group]),
+            opacity=0.6
         ))
 
+    # Empty highlight trace, filled in on top at full opacity by highlight_athlete
+    fig.add_trace(go.Scattergl(
+        x=[],
+        y=[],
+        mode='lines+markers',
+        customdata=[],
+        hovertemplate=hovertemplate,
+        line=dict(width=2),
+        marker=dict(size=8),
+        opacity=1
+    ))
+
     fig.update_layout(
+        template='race',
         title=f'Visualizing: {filename}',
-        title_font_size=24,
-        title_font_family="SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif",
         xaxis=dict(
             title='Segment',
             tickmode='array',
             tickvals=x_values,
             ticktext=x_labels,
             tickangle=45,
-            title_font_size=16,
-            tickfont_size=14,
         ),
         yaxis=dict(
             title=y_axis_title,
             autorange='reversed' if calculation_mode == 'position' else True,
-            title_font_size=16,
-            tickfont_size=14,
         ),
-        font_family="SF Pro Display, -apple-system, BlinkMacSystemFont, sans-serif",
-        hovermode='closest',
-        showlegend=False,
-        height=600,
-        plot_bgcolor='rgba(240,240,240,0.8)',  # Light grey background
-        paper_bgcolor='white',
-        margin=dict(l=50, r=50, t=80, b=50),
     )
 
     if calculation_mode == 'time_gap':
         fig.update_layout(yaxis_range=[max_gap, 0])
 
-    return fig
+    return fig, athlete_paths
 
 # Run the app
 if __name__ == '__main__':